@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "loans.admission.AdmissionControlMiddleware",
+    "loans.query_budget.QueryBudgetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -104,12 +106,132 @@ def _postgres_config_from_url(database_url):
     return config
 
 
+def _sqlite_config_from_url(database_url):
+    parsed = urlparse(database_url)
+    return {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / parsed.path[1:],
+    }
+
+
+def _database_config_from_url(database_url):
+    if urlparse(database_url).scheme == "sqlite":
+        return _sqlite_config_from_url(database_url)
+    return _postgres_config_from_url(database_url)
+
+
 if DATABASE_URL:
-    DATABASES = {"default": _postgres_config_from_url(DATABASE_URL)}
+    DATABASES = {"default": _database_config_from_url(DATABASE_URL)}
 else:
     DATABASES = {"default": _postgres_defaults()}
 
 
+# Customer and loan shards, e.g.
+# SHARD_DATABASE_URLS=sqlite:///shard_0.sqlite3,sqlite:///shard_1.sqlite3
+# Customers and loans live on LOAN_SHARDS[customer_id % len(LOAN_SHARDS)];
+# leave unset to keep everything on the default database.
+
+SHARD_DATABASE_URLS = [url.strip() for url in os.environ.get("SHARD_DATABASE_URLS", "").split(",") if url.strip()]
+
+LOAN_SHARDS = []
+for _index, _url in enumerate(SHARD_DATABASE_URLS):
+    DATABASES[f"shard_{_index}"] = _database_config_from_url(_url)
+    LOAN_SHARDS.append(f"shard_{_index}")
+
+
+# Read replicas, e.g. REPLICA_DATABASE_URLS=sqlite:///replica_0.sqlite3 for the
+# default database and SHARD_0_REPLICA_DATABASE_URLS=... for shard_0. Read-only
+# endpoints use a healthy replica unless the customer wrote within the last
+# REPLICA_PIN_SECONDS. Pins are kept in the default cache, which is shared by
+# every worker process (see CACHES below).
+
+DATABASE_REPLICAS = {}
+for _primary in ["default"] + LOAN_SHARDS:
+    _env = "REPLICA_DATABASE_URLS" if _primary == "default" else f"{_primary.upper()}_REPLICA_DATABASE_URLS"
+    _urls = [url.strip() for url in os.environ.get(_env, "").split(",") if url.strip()]
+    for _index, _url in enumerate(_urls):
+        _alias = f"{_primary}_replica_{_index}"
+        DATABASES[_alias] = _database_config_from_url(_url)
+        DATABASES[_alias]["TEST"] = {"MIRROR": _primary}
+        DATABASE_REPLICAS.setdefault(_primary, []).append(_alias)
+
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", "10"))
+REPLICA_RETRY_SECONDS = int(os.environ.get("REPLICA_RETRY_SECONDS", "30"))
+
+
+# Cache shared by all processes, in the default database (`manage.py createcachetable`
+# creates its table). A per-process cache would lose read-your-writes pins as soon
+# as a write and the following read land on different workers.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "loans_cache",
+    }
+}
+
+DATABASE_ROUTERS = ["loans.routers.ReplicaRouter", "loans.routers.ShardRouter"]
+
+
+# Admission control for the scoring endpoints (per worker process).
+# CAPACITY slots are shared; each endpoint may hold at most CONCURRENCY of them,
+# queue up to QUEUE requests (429 beyond that) and wait MAX_WAIT seconds (503
+# after that). Lower PRIORITY values are admitted first.
+
+ADMISSION_CONTROL = {
+    "CAPACITY": int(os.environ.get("ADMISSION_CAPACITY", "8")),
+    "ENDPOINTS": {
+        "create-loan": {"CONCURRENCY": 8, "QUEUE": 32, "MAX_WAIT": 2.0, "PRIORITY": 0},
+        "check-eligibility": {"CONCURRENCY": 6, "QUEUE": 16, "MAX_WAIT": 0.5, "PRIORITY": 1},
+    },
+}
+
+
+# Query budgets per URL name in loans/urls.py. Requests over budget are logged
+# ("log") or fail ("raise", used by the test suite); None disables the check.
+# QUERIES counts statements on a single database, excluding transaction control.
+# With LOAN_SHARDS set, SHARDED adds QUERIES (e.g. allocating a shard id) plus
+# PER_SHARD for each shard (e.g. the phone number lookup on registration); the
+# first id allocated on an empty shard costs a few queries more.
+# Staff-only endpoints include the session and user lookups of a logged-in request.
+# With DATABASE_REPLICAS set, REPLICATED adds QUERIES for the read-your-writes pins
+# kept in CACHES.
+
+QUERY_BUDGET_ACTION = "log" if DEBUG else None
+
+QUERY_BUDGETS = {
+    "register": {
+        "QUERIES": 2,
+        "SHARDED": {"QUERIES": 2, "PER_SHARD": 1},
+        "REPLICATED": {"QUERIES": 3},
+        "DB_TIME_MS": 200,
+    },
+    "check-eligibility": {"QUERIES": 2, "REPLICATED": {"QUERIES": 1}, "DB_TIME_MS": 100},
+    "create-loan": {"QUERIES": 5, "SHARDED": {"QUERIES": 2}, "REPLICATED": {"QUERIES": 3}, "DB_TIME_MS": 200},
+    "view-loan": {"QUERIES": 2, "DB_TIME_MS": 100},
+    "view-loans": {"QUERIES": 3, "REPLICATED": {"QUERIES": 2}, "DB_TIME_MS": 100},
+    "admission-stats": {"QUERIES": 2, "DB_TIME_MS": 100},
+    "submit-job": {"QUERIES": 3, "DB_TIME_MS": 100},
+    "job-status": {"QUERIES": 4, "DB_TIME_MS": 100},
+    "retry-job": {"QUERIES": 6, "DB_TIME_MS": 100},
+}
+
+
+# Background jobs (loans/jobs.py), stored on the default database and run by
+# `manage.py run_workers`. Workers claim chunks of up to CHUNK_SIZE rows with
+# SELECT ... FOR UPDATE SKIP LOCKED. A failing chunk runs up to MAX_ATTEMPTS
+# times, first retried after RETRY_DELAY seconds (doubling each time); a chunk
+# still running LEASE_SECONDS after it was claimed is handed to another worker.
+
+JOB_QUEUE = {
+    "CHUNK_SIZE": int(os.environ.get("JOB_CHUNK_SIZE", "500")),
+    "MAX_ATTEMPTS": 3,
+    "RETRY_DELAY": 5,
+    "LEASE_SECONDS": 600,
+    "POLL_INTERVAL": 1.0,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -1,3 +1,4 @@
 #!/bin/sh
 python manage.py migrate
+python manage.py createcachetable
 exec "$@"
@@ -0,0 +1,159 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.message = message
+
+
+class _Waiter:
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.admitted = False
+
+
+class AdmissionController:
+    def __init__(self, capacity: int, endpoints: dict):
+        self.capacity = capacity
+        self.endpoints = endpoints
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._stats = {
+            name: {"in_flight": 0, "queued": 0, "admitted": 0, "shed": 0, "timed_out": 0, "max_wait_ms": 0.0}
+            for name in endpoints
+        }
+
+    def _has_slot(self, endpoint: str) -> bool:
+        return self.in_flight < self.capacity and (
+            self._stats[endpoint]["in_flight"] < self.endpoints[endpoint]["CONCURRENCY"]
+        )
+
+    def _outranked(self, priority: int) -> bool:
+        # Only waiters at the same or a better priority that could use a free slot go first.
+        return any(entry[0] <= priority and self._has_slot(entry[2].endpoint) for entry in self._waiting)
+
+    def _admit(self, endpoint: str) -> None:
+        self.in_flight += 1
+        self._stats[endpoint]["in_flight"] += 1
+        self._stats[endpoint]["admitted"] += 1
+
+    def _dispatch(self) -> None:
+        # Hand free slots to waiters in priority order, skipping endpoints at their own limit.
+        blocked = []
+        while self._waiting and self.in_flight < self.capacity:
+            entry = heapq.heappop(self._waiting)
+            waiter = entry[2]
+            if self._has_slot(waiter.endpoint):
+                self._stats[waiter.endpoint]["queued"] -= 1
+                self._admit(waiter.endpoint)
+                waiter.admitted = True
+            else:
+                blocked.append(entry)
+        for entry in blocked:
+            heapq.heappush(self._waiting, entry)
+        self._condition.notify_all()
+
+    def acquire(self, endpoint: str) -> None:
+        config = self.endpoints[endpoint]
+        stats = self._stats[endpoint]
+        with self._condition:
+            if self._has_slot(endpoint) and not self._outranked(config["PRIORITY"]):
+                self._admit(endpoint)
+                return
+            if stats["queued"] >= config["QUEUE"]:
+                stats["shed"] += 1
+                raise Rejected(429, 1, "Too many requests are queued, retry shortly")
+            waiter = _Waiter(endpoint)
+            heapq.heappush(self._waiting, (config["PRIORITY"], next(self._sequence), waiter))
+            stats["queued"] += 1
+            started = time.monotonic()
+            deadline = started + config["MAX_WAIT"]
+            self._dispatch()
+            while not waiter.admitted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            waited_ms = (time.monotonic() - started) * 1000
+            stats["max_wait_ms"] = max(stats["max_wait_ms"], waited_ms)
+            if waiter.admitted:
+                return
+            self._waiting = [entry for entry in self._waiting if entry[2] is not waiter]
+            heapq.heapify(self._waiting)
+            stats["queued"] -= 1
+            stats["timed_out"] += 1
+            raise Rejected(503, max(1, math.ceil(config["MAX_WAIT"])), "Service is overloaded, retry shortly")
+
+    def release(self, endpoint: str) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._stats[endpoint]["in_flight"] -= 1
+            self._dispatch()
+
+    def snapshot(self) -> dict:
+        with self._condition:
+            return {
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiting),
+                "endpoints": {name: dict(stats) for name, stats in self._stats.items()},
+            }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller() -> AdmissionController:
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            config = settings.ADMISSION_CONTROL
+            _controller = AdmissionController(config["CAPACITY"], config["ENDPOINTS"])
+        return _controller
+
+
+@receiver(setting_changed)
+def _reset_controller(setting, **kwargs):
+    global _controller
+    if setting == "ADMISSION_CONTROL":
+        _controller = None
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            endpoint = resolve(request.path_info).url_name
+        except Resolver404:
+            endpoint = None
+        if endpoint not in settings.ADMISSION_CONTROL["ENDPOINTS"]:
+            return self.get_response(request)
+        controller = get_controller()
+        try:
+            controller.acquire(endpoint)
+        except Rejected as rejected:
+            response = JsonResponse({"message": rejected.message}, status=rejected.status)
+            response.headers["Retry-After"] = str(rejected.retry_after)
+            return response
+        try:
+            return self.get_response(request)
+        finally:
+            controller.release(endpoint)
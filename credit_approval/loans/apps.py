@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class LoansConfig(AppConfig):
     name = "loans"
+
+    def ready(self):
+        # Connects the receiver that gives sharded rows their ids.
+        from . import sharding  # noqa: F401
@@ -0,0 +1,240 @@
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import DecimalField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .models import Customer, Loan
+from .sharding import fan_out, is_sharded, reserve_ids, shard_for_customer
+
+CUSTOMER_FIELDS = ["first_name", "last_name", "phone_number", "age", "monthly_income", "approved_limit", "updated_at"]
+LOAN_FIELDS = [
+    "customer",
+    "loan_amount",
+    "tenure",
+    "interest_rate",
+    "monthly_installment",
+    "emis_paid_on_time",
+    "start_date",
+    "end_date",
+    "approved",
+    "updated_at",
+]
+
+
+def _to_decimal(value):
+    if value is None:
+        return Decimal("0")
+    return Decimal(str(value))
+
+
+def _to_date(value):
+    if not value:
+        return None
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _chunks(rows: list, size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+def _by_shard(rows: list) -> dict[str, list]:
+    by_shard = {}
+    for row in rows:
+        by_shard.setdefault(shard_for_customer(row[0]), []).append(row)
+    return by_shard
+
+
+def _last_by_id(objs: list) -> list:
+    # The sheets repeat some ids and the last row wins; PostgreSQL rejects an upsert touching a row twice.
+    return list({obj.id: obj for obj in objs}.values())
+
+
+class JobType(ABC):
+    """A kind of background job, split into chunks that can each be retried."""
+
+    def validate(self, params: dict) -> dict:
+        """Return the normalized params, or raise ValueError."""
+        if params:
+            raise ValueError("This job takes no parameters")
+        return {}
+
+    @abstractmethod
+    def plan(self, params: dict):
+        """Yield (stage, chunk params, rows) for every chunk; stages run in order."""
+
+    @abstractmethod
+    def run(self, params: dict) -> int:
+        """Process one chunk and return the rows it handled. Must be safe to repeat."""
+
+
+class IngestInitialData(JobType):
+    defaults = {"customer_file": "customer_data.xlsx", "loan_file": "loan_data.xlsx"}
+
+    def validate(self, params):
+        unknown = set(params) - set(self.defaults)
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        params = {**self.defaults, **params}
+        data_dir = Path(settings.BASE_DIR).resolve()
+        for name in params.values():
+            path = (data_dir / str(name)).resolve()
+            if path.parent != data_dir or path.suffix != ".xlsx":
+                raise ValueError(f"'{name}' must be an .xlsx file in the project root")
+            if not path.exists():
+                raise ValueError(f"Data file '{name}' not found in the project root")
+        return params
+
+    def plan(self, params):
+        data_dir = Path(settings.BASE_DIR)
+        size = settings.JOB_QUEUE["CHUNK_SIZE"]
+        customers = self._read_rows(data_dir / params["customer_file"], id_columns=1, width=7)
+        loans = self._read_rows(data_dir / params["loan_file"], id_columns=2, width=9)
+        # Loans need their customers in place, and ids are reserved once everything is loaded.
+        # Each chunk holds one shard's rows, so workers load the shards in parallel.
+        for stage, step, step_rows in ((0, "customers", customers), (1, "loans", loans)):
+            for alias, shard_rows in _by_shard(step_rows).items():
+                for rows in _chunks(shard_rows, size):
+                    yield stage, {"step": step, "alias": alias, "rows": rows}, len(rows)
+        floors = {
+            "customer_floor": max((row[0] for row in customers), default=0),
+            "loan_floor": max((row[1] for row in loans), default=0),
+        }
+        yield 2, {"step": "reserve_ids", **floors}, 0
+
+    def run(self, params):
+        step = params["step"]
+        if step == "reserve_ids":
+            self._reserve_ids(params["customer_floor"], params["loan_floor"])
+            return 0
+        load = self._load_customers if step == "customers" else self._load_loans
+        with transaction.atomic(using=params["alias"]):
+            load(params["alias"], params["rows"])
+        return len(params["rows"])
+
+    def _read_rows(self, file_path: Path, id_columns: int, width: int) -> list[list]:
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            rows = []
+            for row in workbook.active.iter_rows(min_row=2, values_only=True):
+                if not row or not row[0]:
+                    continue
+                # Chunk params are stored as JSON, so dates are kept as dates rather than datetimes.
+                row = [value.date() if isinstance(value, datetime) else value for value in row[:width]]
+                rows.append([int(value) for value in row[:id_columns]] + row[id_columns:])
+            return rows
+        finally:
+            workbook.close()
+
+    def _load_customers(self, alias: str, rows: list[list]) -> None:
+        customers = [
+            Customer(
+                id=customer_id,
+                first_name=str(first_name).strip(),
+                last_name=str(last_name).strip(),
+                phone_number=str(phone_number).strip(),
+                age=int(age or 0),
+                monthly_income=int(_to_decimal(monthly_salary)),
+                approved_limit=_to_decimal(approved_limit),
+            )
+            for customer_id, first_name, last_name, age, phone_number, monthly_salary, approved_limit in rows
+        ]
+        Customer.objects.using(alias).bulk_create(
+            _last_by_id(customers), update_conflicts=True, unique_fields=["id"], update_fields=CUSTOMER_FIELDS
+        )
+
+    def _load_loans(self, alias: str, rows: list[list]) -> None:
+        known = set(Customer.objects.using(alias).filter(id__in={row[0] for row in rows}).values_list("id", flat=True))
+        loans = [
+            Loan(
+                id=loan_id,
+                customer_id=customer_id,
+                loan_amount=_to_decimal(loan_amount),
+                tenure=int(tenure or 0),
+                interest_rate=_to_decimal(interest_rate),
+                monthly_installment=_to_decimal(monthly_repayment),
+                emis_paid_on_time=int(emis_paid_on_time or 0),
+                start_date=_to_date(start_date),
+                end_date=_to_date(end_date),
+                approved=True,
+            )
+            for (
+                customer_id,
+                loan_id,
+                loan_amount,
+                tenure,
+                interest_rate,
+                monthly_repayment,
+                emis_paid_on_time,
+                start_date,
+                end_date,
+            ) in rows
+            if customer_id in known
+        ]
+        Loan.objects.using(alias).bulk_create(
+            _last_by_id(loans), update_conflicts=True, unique_fields=["id"], update_fields=LOAN_FIELDS
+        )
+        # bulk_create sends no post_save signals, so move the customers' ETag version here.
+        Customer.objects.using(alias).filter(id__in={loan.customer_id for loan in loans}).update(
+            updated_at=timezone.now()
+        )
+
+    def _reserve_ids(self, customer_floor: int, loan_floor: int) -> None:
+        if is_sharded():
+            # New ids must never collide with spreadsheet ids living on another shard.
+            reserve_ids(Customer, customer_floor)
+            reserve_ids(Loan, loan_floor)
+            return
+        connection = connections["default"]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Customer, Loan]):
+                cursor.execute(sql)
+
+
+class RefreshCurrentDebt(JobType):
+    def plan(self, params):
+        size = settings.JOB_QUEUE["CHUNK_SIZE"]
+        # Each shard's ids are read on its own connection, in parallel when sharded.
+        ids_by_shard = fan_out(
+            lambda alias: list(Customer.objects.using(alias).order_by("id").values_list("id", flat=True))
+        )
+        for alias, ids in ids_by_shard.items():
+            for batch in _chunks(ids, size):
+                yield 0, {"alias": alias, "first_id": batch[0], "last_id": batch[-1]}, len(batch)
+
+    def run(self, params):
+        alias = params["alias"]
+        active_amount = (
+            Loan.objects.filter(customer=OuterRef("pk"), end_date__gte=timezone.now().date())
+            .order_by()
+            .values("customer")
+            .annotate(total=Sum("loan_amount"))
+            .values("total")
+        )
+        return (
+            Customer.objects.using(alias)
+            .filter(id__range=(params["first_id"], params["last_id"]))
+            .update(
+                current_debt=Coalesce(
+                    Subquery(active_amount),
+                    Decimal("0"),
+                    output_field=DecimalField(max_digits=14, decimal_places=2),
+                )
+            )
+        )
+
+
+JOB_TYPES = {
+    "ingest_initial_data": IngestInitialData(),
+    "refresh_current_debt": RefreshCurrentDebt(),
+}
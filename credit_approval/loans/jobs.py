@@ -0,0 +1,231 @@
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .batches import JOB_TYPES
+from .models import Job, JobChunk
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def submit(kind: str, params: dict | None = None) -> Job:
+    """Queue a job after validating its params; raises ValueError for bad params."""
+    return Job.objects.create(kind=kind, params=JOB_TYPES[kind].validate(params or {}))
+
+
+def retry(job: Job) -> str | None:
+    """Requeue the failed chunks of a failed job and return its new status, or None if it had not failed."""
+    # A job that failed while planning has no chunks and goes back to the queue.
+    status = Job.Status.RUNNING if job.chunks.exists() else Job.Status.QUEUED
+    with transaction.atomic():
+        failed = Job.objects.filter(pk=job.pk, status=Job.Status.FAILED)
+        if not failed.update(status=status, error="", finished_at=None):
+            return None
+        job.chunks.filter(status=JobChunk.Status.FAILED).update(
+            status=JobChunk.Status.PENDING, attempts=0, run_after=timezone.now(), error=""
+        )
+    return status
+
+
+def _jobs(job_id: int | None):
+    return Job.objects.filter(pk=job_id) if job_id is not None else Job.objects.all()
+
+
+def plan_next_job(worker: str, job_id: int | None = None) -> Job | None:
+    # Planning runs with the job row locked, so each job is split exactly once.
+    with transaction.atomic():
+        queued = _jobs(job_id).select_for_update(skip_locked=True).filter(status=Job.Status.QUEUED)
+        job = queued.order_by("id").first()
+        if job is None:
+            return None
+        job.started_at = timezone.now()
+        try:
+            chunks = [
+                JobChunk(job=job, stage=stage, params=params, rows=rows)
+                for stage, params, rows in JOB_TYPES[job.kind].plan(job.params)
+            ]
+        except Exception as exc:
+            logger.exception("Planning job %s failed on %s", job.pk, worker)
+            job.status = Job.Status.FAILED
+            job.error = f"{type(exc).__name__}: {exc}"
+            job.finished_at = timezone.now()
+            job.save()
+            return job
+        JobChunk.objects.bulk_create(chunks, batch_size=500)
+        job.total_rows = sum(chunk.rows for chunk in chunks)
+        job.status = Job.Status.RUNNING if chunks else Job.Status.SUCCEEDED
+        job.finished_at = None if chunks else timezone.now()
+        job.save()
+        return job
+
+
+def claim_chunk(worker: str, job_id: int | None = None) -> JobChunk | None:
+    config = settings.JOB_QUEUE
+    now = timezone.now()
+    earlier_stage_open = JobChunk.objects.filter(job=OuterRef("job"), stage__lt=OuterRef("stage")).exclude(
+        status=JobChunk.Status.DONE
+    )
+    # A chunk still running LEASE_SECONDS after it was claimed belongs to a dead worker.
+    abandoned = Q(
+        status=JobChunk.Status.RUNNING,
+        locked_at__lt=now - timedelta(seconds=config["LEASE_SECONDS"]),
+        attempts__lt=config["MAX_ATTEMPTS"],
+    )
+    with transaction.atomic():
+        chunk = (
+            JobChunk.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("job")
+            .filter(job__in=_jobs(job_id).filter(status=Job.Status.RUNNING))
+            .filter(Q(status=JobChunk.Status.PENDING, run_after__lte=now) | abandoned)
+            .filter(~Exists(earlier_stage_open))
+            .order_by("job_id", "stage", "id")
+            .first()
+        )
+        if chunk is None:
+            return None
+        chunk.status = JobChunk.Status.RUNNING
+        chunk.attempts += 1
+        chunk.locked_by = worker
+        chunk.locked_at = now
+        chunk.save(update_fields=["status", "attempts", "locked_by", "locked_at"])
+    return chunk
+
+
+def run_chunk(chunk: JobChunk, worker: str) -> None:
+    try:
+        rows = JOB_TYPES[chunk.job.kind].run(chunk.params)
+    except Exception as exc:
+        logger.exception("Chunk %s of job %s failed on %s", chunk.pk, chunk.job_id, worker)
+        _fail_chunk(chunk, worker, f"{type(exc).__name__}: {exc}")
+        return
+    owned = JobChunk.objects.filter(pk=chunk.pk, locked_by=worker, attempts=chunk.attempts)
+    with transaction.atomic():
+        # A chunk reclaimed after its lease ran out is counted by whichever worker finishes it first.
+        if not owned.filter(status=JobChunk.Status.RUNNING).update(status=JobChunk.Status.DONE, locked_at=None):
+            return
+        Job.objects.filter(pk=chunk.job_id).update(processed_rows=F("processed_rows") + rows)
+    if not JobChunk.objects.filter(job_id=chunk.job_id).exclude(status=JobChunk.Status.DONE).exists():
+        Job.objects.filter(pk=chunk.job_id, status=Job.Status.RUNNING).update(
+            status=Job.Status.SUCCEEDED, finished_at=timezone.now()
+        )
+
+
+def _fail_chunk(chunk: JobChunk, worker: str, error: str) -> None:
+    config = settings.JOB_QUEUE
+    owned = JobChunk.objects.filter(pk=chunk.pk, locked_by=worker, attempts=chunk.attempts)
+    if chunk.attempts < config["MAX_ATTEMPTS"]:
+        delay = config["RETRY_DELAY"] * 2 ** (chunk.attempts - 1)
+        owned.update(
+            status=JobChunk.Status.PENDING,
+            run_after=timezone.now() + timedelta(seconds=delay),
+            locked_at=None,
+            error=error,
+        )
+        return
+    with transaction.atomic():
+        if owned.update(status=JobChunk.Status.FAILED, locked_at=None, error=error):
+            Job.objects.filter(pk=chunk.job_id, status=Job.Status.RUNNING).update(
+                status=Job.Status.FAILED, error=error, finished_at=timezone.now()
+            )
+
+
+def fail_abandoned_chunks(job_id: int | None = None) -> None:
+    config = settings.JOB_QUEUE
+    expired = timezone.now() - timedelta(seconds=config["LEASE_SECONDS"])
+    abandoned = JobChunk.objects.filter(
+        job__in=_jobs(job_id),
+        status=JobChunk.Status.RUNNING,
+        locked_at__lt=expired,
+        attempts__gte=config["MAX_ATTEMPTS"],
+    )
+    with transaction.atomic():
+        job_ids = list(abandoned.values_list("job_id", flat=True).distinct())
+        if not job_ids:
+            return
+        abandoned.update(status=JobChunk.Status.FAILED, locked_at=None, error="Worker stopped responding")
+        Job.objects.filter(pk__in=job_ids, status=Job.Status.RUNNING).update(
+            status=Job.Status.FAILED, error="Worker stopped responding", finished_at=timezone.now()
+        )
+
+
+def has_open_jobs(job_id: int | None = None) -> bool:
+    return _jobs(job_id).filter(status__in=[Job.Status.QUEUED, Job.Status.RUNNING]).exists()
+
+
+def _step(worker: str, job_id: int | None) -> bool:
+    if plan_next_job(worker, job_id) is not None:
+        return True
+    chunk = claim_chunk(worker, job_id)
+    if chunk is not None:
+        run_chunk(chunk, worker)
+        return True
+    fail_abandoned_chunks(job_id)
+    return False
+
+
+def work(
+    worker: str | None = None,
+    burst: bool = False,
+    stop: threading.Event | None = None,
+    job_id: int | None = None,
+) -> None:
+    """Plan queued jobs and process chunks until stopped; with burst, until no job is open.
+
+    With job_id, only that job is worked on and burst stops once it is done.
+    """
+    worker = worker or worker_name()
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            if _step(worker, job_id):
+                continue
+            if burst and not has_open_jobs(job_id):
+                break
+        except DatabaseError:
+            # Chunks claimed before the error are picked up again once their lease runs out.
+            logger.exception("Worker %s hit a database error", worker)
+            close_old_connections()
+        stop.wait(settings.JOB_QUEUE["POLL_INTERVAL"])
+    close_old_connections()
+
+
+def progress(job: Job) -> dict:
+    counts = dict(job.chunks.order_by().values_list("status").annotate(total=Count("id")))
+    end = job.finished_at or timezone.now()
+    elapsed = (end - job.started_at).total_seconds() if job.started_at else 0.0
+    throughput = job.processed_rows / elapsed if elapsed > 0 else 0.0
+    remaining = max(job.total_rows - job.processed_rows, 0)
+    if job.status == Job.Status.SUCCEEDED:
+        eta = 0.0
+    elif job.status == Job.Status.RUNNING and throughput:
+        eta = remaining / throughput
+    else:
+        eta = None
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": job.params,
+        "total_rows": job.total_rows,
+        "processed_rows": job.processed_rows,
+        "throughput_rows_per_second": round(throughput, 2),
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+        "elapsed_seconds": round(elapsed, 1),
+        "chunks": {status: counts.get(status, 0) for status in JobChunk.Status.values},
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
@@ -1,101 +1,57 @@
-from decimal import Decimal
-from pathlib import Path
-
-from django.conf import settings
 from django.core.management.base import BaseCommand
-from openpyxl import load_workbook
-
-from ...models import Customer, Loan
-
-
-def _to_decimal(value):
-    if value is None:
-        return Decimal("0")
-    return Decimal(str(value))
 
-
-def _to_date(value):
-    if not value:
-        return None
-    return value.date() if hasattr(value, "date") else value
+from ...jobs import progress, submit, work
+from ...models import Job
 
 
 class Command(BaseCommand):
     help = "Load the provided customer and loan spreadsheets into the database"
 
-    def handle(self, *args, **options):
-        data_dir = Path(settings.BASE_DIR)
-        customer_path = data_dir / "customer_data.xlsx"
-        loan_path = data_dir / "loan_data.xlsx"
-        if not customer_path.exists() or not loan_path.exists():
-            self.stdout.write(self.style.ERROR("Data files not found in the project root."))
-            return
-        self._load_customers(customer_path)
-        self._load_loans(loan_path)
-        self.stdout.write(self.style.SUCCESS("Customer and loan data successfully ingested."))
+    def add_arguments(self, parser):
+        parser.add_argument("--customer-file", default="customer_data.xlsx")
+        parser.add_argument("--loan-file", default="loan_data.xlsx")
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help="Only submit the ingest job and leave it to run_workers",
+        )
+        parser.add_argument(
+            "--if-not-done",
+            action="store_true",
+            help="Do nothing if an ingest job has already succeeded or is still queued or running",
+        )
 
-    def _load_customers(self, file_path: Path) -> None:
-        workbook = load_workbook(file_path)
-        sheet = workbook.active
-        rows = sheet.iter_rows(min_row=2, values_only=True)
-        for row in rows:
-            if not row or not row[0]:
-                continue
-            (
-                customer_id,
-                first_name,
-                last_name,
-                phone_number,
-                monthly_salary,
-                approved_limit,
-                current_debt,
-            ) = row
-            Customer.objects.update_or_create(
-                id=int(customer_id),
-                defaults={
-                    "first_name": str(first_name).strip(),
-                    "last_name": str(last_name).strip(),
-                    "phone_number": str(phone_number).strip(),
-                    "age": 0,
-                    "monthly_income": int(_to_decimal(monthly_salary)),
-                    "approved_limit": _to_decimal(approved_limit),
-                    "current_debt": _to_decimal(current_debt),
-                },
+    def handle(self, *args, **options):
+        if options["if_not_done"]:
+            existing = (
+                Job.objects.filter(kind="ingest_initial_data")
+                .exclude(status=Job.Status.FAILED)
+                .order_by("-id")
+                .first()
             )
-
-    def _load_loans(self, file_path: Path) -> None:
-        workbook = load_workbook(file_path)
-        sheet = workbook.active
-        rows = sheet.iter_rows(min_row=2, values_only=True)
-        for row in rows:
-            if not row or not row[0]:
-                continue
-            (
-                customer_id,
-                loan_id,
-                loan_amount,
-                tenure,
-                interest_rate,
-                monthly_repayment,
-                emis_paid_on_time,
-                start_date,
-                end_date,
-            ) = row
-            try:
-                customer = Customer.objects.get(id=int(customer_id))
-            except Customer.DoesNotExist:
-                continue
-            Loan.objects.update_or_create(
-                id=int(loan_id),
-                defaults={
-                    "customer": customer,
-                    "loan_amount": _to_decimal(loan_amount),
-                    "tenure": int(tenure or 0),
-                    "interest_rate": _to_decimal(interest_rate),
-                    "monthly_installment": _to_decimal(monthly_repayment),
-                    "emis_paid_on_time": int(emis_paid_on_time or 0),
-                    "start_date": _to_date(start_date),
-                    "end_date": _to_date(end_date),
-                    "approved": True,
-                },
+            if existing is not None:
+                self.stdout.write(f"Ingest job {existing.id} is {existing.status}; nothing to do.")
+                return
+        try:
+            job = submit(
+                "ingest_initial_data",
+                {"customer_file": options["customer_file"], "loan_file": options["loan_file"]},
             )
+        except ValueError as exc:
+            self.stdout.write(self.style.ERROR(str(exc)))
+            return
+        if options["enqueue"]:
+            self.stdout.write(self.style.SUCCESS(f"Queued ingest job {job.id}."))
+            return
+        # Other queued jobs are left to run_workers.
+        work(burst=True, job_id=job.id)
+        job.refresh_from_db()
+        report = progress(job)
+        if job.status != Job.Status.SUCCEEDED:
+            self.stdout.write(self.style.ERROR(f"Ingest job {job.id} {job.status}: {job.error}"))
+            return
+        self.stdout.write(
+            f"Ingested {report['processed_rows']} rows in {report['elapsed_seconds']}s "
+            f"({report['throughput_rows_per_second']} rows/s)."
+        )
+        self.stdout.write(self.style.SUCCESS("Customer and loan data successfully ingested."))
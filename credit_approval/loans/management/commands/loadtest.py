@@ -0,0 +1,325 @@
+import asyncio
+import http.client
+import itertools
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from ...models import Customer, Loan
+from ...sharding import all_shards
+
+ENDPOINTS = ["register", "check-eligibility", "create-loan", "view-loan", "view-loans"]
+DEFAULT_MIX = "register=1,check-eligibility=3,create-loan=2,view-loan=4,view-loans=4"
+DEFAULT_REQUESTS = 1000
+
+
+def _parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise CommandError(f"Unknown endpoint '{name}' in --mix; choose from {', '.join(ENDPOINTS)}")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError as exc:
+            raise CommandError(f"Invalid weight for '{name}' in --mix") from exc
+    if not any(mix.values()):
+        raise CommandError("--mix needs at least one positive weight")
+    return mix
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _has_budget(counter, total: int | None, deadline: float | None) -> bool:
+    # A None total runs until the deadline; a None deadline runs until total requests are sent.
+    if total is not None and next(counter) >= total:
+        return False
+    return deadline is None or time.monotonic() < deadline
+
+
+class _Workload:
+    def __init__(self, mix: dict[str, float], customer_ids: list[int], loan_ids: list[int], seed: int | None):
+        self.names = list(mix)
+        self.weights = list(mix.values())
+        self.customer_ids = customer_ids
+        self.loan_ids = loan_ids
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_request(self) -> tuple[str, str, str, dict | None]:
+        with self._lock:
+            name = self.random.choices(self.names, self.weights)[0]
+            customer_id = self.random.choice(self.customer_ids) if self.customer_ids else 1
+            loan_id = self.random.choice(self.loan_ids) if self.loan_ids else 1
+            if name == "register":
+                body = {
+                    "first_name": "Load",
+                    "last_name": "Test",
+                    "age": self.random.randint(21, 65),
+                    "monthly_income": self.random.randrange(20000, 200000, 1000),
+                    "phone_number": f"7{self.random.randrange(10**9):09d}",
+                }
+                return name, "POST", reverse("register"), body
+            if name in ("check-eligibility", "create-loan"):
+                body = {
+                    "customer_id": customer_id,
+                    "loan_amount": self.random.randrange(50000, 1000000, 10000),
+                    "interest_rate": round(self.random.uniform(8, 18), 2),
+                    "tenure": self.random.choice([6, 12, 24, 36]),
+                }
+                return name, "POST", reverse(name), body
+            if name == "view-loan":
+                return name, "GET", reverse("view-loan", args=[loan_id]), None
+            return name, "GET", reverse("view-loans", args=[customer_id]), None
+
+    def observe(self, name: str, status: int, payload: bytes) -> None:
+        if name == "create-loan" and status == 201:
+            try:
+                loan_id = json.loads(payload)["loan_id"]
+            except (ValueError, KeyError):
+                return
+            with self._lock:
+                self.loan_ids.append(loan_id)
+
+
+class _InProcessTransport:
+    def __init__(self):
+        self.client = Client(raise_request_exception=False, HTTP_HOST="localhost")
+
+    def send(self, method, path, body):
+        if method == "GET":
+            response = self.client.get(path)
+        else:
+            response = self.client.post(path, data=json.dumps(body), content_type="application/json")
+        return response.status_code, response.content
+
+
+class _HttpTransport:
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.prefix = parts.path.rstrip("/")
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    def send(self, method, path, body):
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            self.connection.request(method, self.prefix + path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            raise
+
+
+class _AsyncInProcessTransport:
+    def __init__(self):
+        self.client = AsyncClient(raise_request_exception=False, HTTP_HOST="localhost")
+
+    async def send(self, method, path, body):
+        if method == "GET":
+            response = await self.client.get(path)
+        else:
+            response = await self.client.post(path, data=json.dumps(body), content_type="application/json")
+        return response.status_code, response.content
+
+
+class _AsyncHttpTransport:
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+
+    async def send(self, method, path, body):
+        payload = json.dumps(body).encode() if body is not None else b""
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            head = (
+                f"{method} {self.prefix + path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n"
+            )
+            writer.write(head.encode() + payload)
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        status_line, _, rest = response.partition(b"\r\n")
+        _, _, content = rest.partition(b"\r\n\r\n")
+        return int(status_line.split()[1]), content
+
+
+class Command(BaseCommand):
+    help = "Replay a weighted mix of API calls and report throughput and latency per endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=None,
+            help=f"Total number of requests to send (default {DEFAULT_REQUESTS}, or unlimited with --duration)",
+        )
+        parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--mode", choices=["threads", "asyncio"], default="threads")
+        parser.add_argument(
+            "--target",
+            default="wsgi",
+            help="'wsgi' or 'asgi' for the in-process app, or a base URL such as http://localhost:8000",
+        )
+        parser.add_argument("--mix", default=DEFAULT_MIX, help="Comma-separated endpoint=weight pairs")
+        parser.add_argument("--sample", type=int, default=1000, help="Customer and loan ids to load per database")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--format", choices=["text", "json"], default="text")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or (options["requests"] is not None and options["requests"] < 1):
+            raise CommandError("--concurrency and --requests must be positive")
+        if options["duration"] is not None and options["duration"] <= 0:
+            raise CommandError("--duration must be positive")
+        total = options["requests"]
+        if total is None and options["duration"] is None:
+            total = DEFAULT_REQUESTS
+        target = options["target"]
+        if target not in ("wsgi", "asgi") and not target.startswith("http://"):
+            raise CommandError("--target must be 'wsgi', 'asgi' or an http:// URL")
+        if target == "wsgi" and options["mode"] == "asyncio":
+            raise CommandError("The in-process WSGI target needs --mode threads; use --target asgi for asyncio")
+        if target == "asgi" and options["mode"] == "threads":
+            raise CommandError("The in-process ASGI target needs --mode asyncio")
+        workload = _Workload(_parse_mix(options["mix"]), *self._sample_ids(options["sample"]), options["seed"])
+        deadline = time.monotonic() + options["duration"] if options["duration"] else None
+        started = time.monotonic()
+        if options["mode"] == "threads":
+            samples = self._run_threads(workload, target, options["concurrency"], total, deadline)
+        else:
+            samples = asyncio.run(
+                self._run_asyncio(workload, target, options["concurrency"], total, deadline)
+            )
+        report = self._report(samples, time.monotonic() - started, options)
+        if options["format"] == "json":
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._write_text(report)
+
+    def _sample_ids(self, sample: int) -> tuple[list[int], list[int]]:
+        customer_ids, loan_ids = [], []
+        for alias in all_shards():
+            customer_ids.extend(Customer.objects.using(alias).values_list("id", flat=True)[:sample])
+            loan_ids.extend(Loan.objects.using(alias).filter(approved=True).values_list("id", flat=True)[:sample])
+        if not customer_ids:
+            raise CommandError("No customers found; run ingest_initial_data first")
+        return customer_ids, loan_ids
+
+    def _run_threads(self, workload, target, concurrency, total, deadline):
+        counter = itertools.count()
+        samples = []
+        lock = threading.Lock()
+
+        def worker():
+            transport = _InProcessTransport() if target == "wsgi" else _HttpTransport(target)
+            local = []
+            while _has_budget(counter, total, deadline):
+                name, method, path, body = workload.next_request()
+                began = time.perf_counter()
+                try:
+                    status, payload = transport.send(method, path, body)
+                except Exception:
+                    status, payload = 0, b""
+                local.append((name, time.perf_counter() - began, status))
+                workload.observe(name, status, payload)
+            with lock:
+                samples.extend(local)
+
+        if concurrency == 1:
+            worker()
+            return samples
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples
+
+    async def _run_asyncio(self, workload, target, concurrency, total, deadline):
+        counter = itertools.count()
+        samples = []
+
+        async def worker():
+            transport = _AsyncInProcessTransport() if target == "asgi" else _AsyncHttpTransport(target)
+            while _has_budget(counter, total, deadline):
+                name, method, path, body = workload.next_request()
+                began = time.perf_counter()
+                try:
+                    status, payload = await transport.send(method, path, body)
+                except Exception:
+                    status, payload = 0, b""
+                samples.append((name, time.perf_counter() - began, status))
+                workload.observe(name, status, payload)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return samples
+
+    def _summarize(self, samples, elapsed):
+        latencies = sorted(latency * 1000 for _, latency, _ in samples)
+        statuses = {}
+        for _, _, status in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        # Status 0 marks a transport failure; 4xx business rejections are not errors.
+        errors = sum(1 for _, _, status in samples if status == 0 or status >= 500)
+        return {
+            "requests": len(samples),
+            "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(_percentile(latencies, 0.50), 2),
+            "p95_ms": round(_percentile(latencies, 0.95), 2),
+            "p99_ms": round(_percentile(latencies, 0.99), 2),
+            "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+            "statuses": dict(sorted(statuses.items())),
+        }
+
+    def _report(self, samples, elapsed, options):
+        by_endpoint = {}
+        for sample in samples:
+            by_endpoint.setdefault(sample[0], []).append(sample)
+        return {
+            "target": options["target"],
+            "mode": options["mode"],
+            "concurrency": options["concurrency"],
+            "elapsed_s": round(elapsed, 3),
+            "total": self._summarize(samples, elapsed),
+            "endpoints": {
+                name: self._summarize(by_endpoint[name], elapsed) for name in ENDPOINTS if name in by_endpoint
+            },
+        }
+
+    def _write_text(self, report):
+        self.stdout.write(
+            f"target={report['target']} mode={report['mode']} concurrency={report['concurrency']} "
+            f"elapsed={report['elapsed_s']}s"
+        )
+        self.stdout.write(
+            f"{'endpoint':<18}{'requests':>9}{'rps':>10}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}  statuses"
+        )
+        rows = list(report["endpoints"].items()) + [("total", report["total"])]
+        for name, summary in rows:
+            statuses = " ".join(f"{status}:{count}" for status, count in summary["statuses"].items())
+            self.stdout.write(
+                f"{name:<18}{summary['requests']:>9}{summary['throughput_rps']:>10}{summary['p50_ms']:>10}"
+                f"{summary['p95_ms']:>10}{summary['p99_ms']:>10}{summary['error_rate']:>9.2%}  {statuses}"
+            )
@@ -0,0 +1,58 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ...jobs import work, worker_name
+
+
+def _run_worker(burst: bool, child: bool) -> None:
+    stop = threading.Event()
+    # Stopping waits for the chunk in progress. Children ignore Ctrl-C; the parent forwards it as SIGTERM.
+    previous = {
+        signal.SIGINT: signal.signal(signal.SIGINT, signal.SIG_IGN if child else lambda signum, frame: stop.set()),
+        signal.SIGTERM: signal.signal(signal.SIGTERM, lambda signum, frame: stop.set()),
+    }
+    try:
+        work(worker_name(), burst=burst, stop=stop)
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+
+class Command(BaseCommand):
+    help = "Run background job workers that plan queued jobs and process their chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1, help="Number of worker processes")
+        parser.add_argument("--burst", action="store_true", help="Exit once no job is queued or running")
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        if processes < 1:
+            raise CommandError("--processes must be positive")
+        self.stdout.write(f"Starting {processes} worker process(es)")
+        if processes == 1:
+            _run_worker(options["burst"], child=False)
+            return
+        # Children must not share the parent's database sockets.
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=_run_worker, args=(options["burst"], True)) for _ in range(processes)]
+        for process in workers:
+            process.start()
+
+        def stop(signum, frame):
+            for process in workers:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        for process in workers:
+            process.join()
+        failed = [process.pid for process in workers if process.exitcode]
+        if failed:
+            raise CommandError(f"Worker processes {failed} exited with an error")
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShardSequence",
+            fields=[
+                ("name", models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ("last_value", models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0002_shard_sequence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customer",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="loan",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
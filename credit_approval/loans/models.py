@@ -1,4 +1,7 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 
 
@@ -11,11 +14,20 @@ class Customer(models.Model):
     approved_limit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     current_debt = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.phone_number})"
 
     @property
     def name(self):
         return f"{self.first_name} {self.last_name}"
 
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is not None:
+            update_fields = {*update_fields, "updated_at"}
+        super().save(*args, update_fields=update_fields, **kwargs)
+
 
 class Loan(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="loans")
@@ -28,7 +40,65 @@ class Loan(models.Model):
     end_date = models.DateField()
     approved = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     @property
     def is_active(self):
         return self.end_date >= timezone.now().date()
+
+
+# The customer's updated_at validates every cached view of its loans. A
+# post_delete receiver also makes queryset deletes (e.g. the admin's bulk
+# action) fetch and signal each loan instead of using a fast delete.
+@receiver(post_save, sender=Loan)
+@receiver(post_delete, sender=Loan)
+def _touch_customer(sender, instance, using, **kwargs):
+    Customer.objects.using(using).filter(id=instance.customer_id).update(updated_at=timezone.now())
+
+
+class ShardSequence(models.Model):
+    name = models.CharField(max_length=100, primary_key=True)
+    last_value = models.BigIntegerField(default=0)
+
+
+class Job(models.Model):
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        SUCCEEDED = "succeeded"
+        FAILED = "failed"
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    total_rows = models.PositiveBigIntegerField(default=0)
+    processed_rows = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+
+class JobChunk(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name="chunks")
+    stage = models.PositiveSmallIntegerField(default=0)
+    params = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    rows = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
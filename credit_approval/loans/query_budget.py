@@ -0,0 +1,96 @@
+import logging
+import time
+from contextlib import ExitStack
+from functools import cache
+
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+# Transaction control is not a statement the view asked for: SQLite sends BEGIN for
+# each outermost atomic block, and nested blocks (e.g. update_or_create inside a
+# test's transaction) add savepoints.
+TRANSACTION_SQL = ("BEGIN", "START TRANSACTION", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE SAVEPOINT")
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = 0
+        self.db_time_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(TRANSACTION_SQL):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time_ms += (time.perf_counter() - started) * 1000
+
+    def record(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+@cache
+def budgeted_url_names() -> frozenset[str]:
+    from .urls import urlpatterns
+
+    return frozenset(pattern.name for pattern in urlpatterns)
+
+
+def query_limit(budget: dict) -> int:
+    limit = budget["QUERIES"]
+    if getattr(settings, "DATABASE_REPLICAS", {}):
+        limit += budget.get("REPLICATED", {}).get("QUERIES", 0)
+    shards = len(getattr(settings, "LOAN_SHARDS", []))
+    if shards:
+        sharded = budget.get("SHARDED", {})
+        limit += sharded.get("QUERIES", 0) + sharded.get("PER_SHARD", 0) * shards
+    return limit
+
+
+def check_budget(url_name: str, recorder: QueryRecorder) -> None:
+    budget = settings.QUERY_BUDGETS.get(url_name)
+    if budget is None:
+        message = f"No query budget is defined for '{url_name}'"
+    elif recorder.queries > query_limit(budget) or recorder.db_time_ms > budget["DB_TIME_MS"]:
+        message = (
+            f"'{url_name}' ran {recorder.queries} queries in {recorder.db_time_ms:.1f}ms, "
+            f"over its budget of {query_limit(budget)} queries and {budget['DB_TIME_MS']}ms"
+        )
+    else:
+        return
+    if settings.QUERY_BUDGET_ACTION == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_ACTION:
+            return self.get_response(request)
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return self.get_response(request)
+        if match.url_name not in budgeted_url_names():
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+        check_budget(match.url_name, recorder)
+        return response
@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+_unhealthy_until = {}
+
+
+def replicas_for(primary: str) -> list[str]:
+    return list(getattr(settings, "DATABASE_REPLICAS", {}).get(primary, []))
+
+
+def primary_for(alias: str) -> str:
+    for primary, replicas in getattr(settings, "DATABASE_REPLICAS", {}).items():
+        if alias in replicas:
+            return primary
+    return alias
+
+
+def is_replica(alias: str) -> bool:
+    return primary_for(alias) != alias
+
+
+def _pin_key(customer_id: int) -> str:
+    return f"loans:replica-pin:{customer_id}"
+
+
+def pin_customer(customer_id: int) -> None:
+    if getattr(settings, "DATABASE_REPLICAS", {}):
+        cache.set(_pin_key(customer_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(customer_id: int) -> bool:
+    return bool(cache.get(_pin_key(customer_id)))
+
+
+def mark_unhealthy(alias: str) -> None:
+    _unhealthy_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+
+
+def _is_healthy(alias: str) -> bool:
+    if _unhealthy_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        mark_unhealthy(alias)
+        return False
+    return True
+
+
+def read_database(primary: str, customer_id: int | None = None) -> str:
+    replicas = replicas_for(primary)
+    if not replicas or (customer_id is not None and is_pinned(customer_id)):
+        return primary
+    random.shuffle(replicas)
+    for alias in replicas:
+        if _is_healthy(alias):
+            return alias
+    return primary
@@ -0,0 +1,74 @@
+from django.core.exceptions import ImproperlyConfigured
+
+from .replicas import is_replica, primary_for
+from .sharding import shard_aliases, shard_for_customer
+
+SHARDED_MODELS = {"customer", "loan", "shardsequence"}
+
+
+class ShardRouter:
+    def _shard_for_instance(self, instance):
+        if instance is None:
+            return None
+        if instance._state.db:
+            return instance._state.db
+        model_name = instance._meta.model_name
+        if model_name == "customer" and instance.pk:
+            return shard_for_customer(instance.pk)
+        if model_name == "loan" and instance.customer_id:
+            return shard_for_customer(instance.customer_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        if not shard_aliases() or model._meta.model_name not in SHARDED_MODELS:
+            return None
+        alias = self._shard_for_instance(hints.get("instance"))
+        if alias is None:
+            # Falling through to default would fail later with "no such table".
+            raise ImproperlyConfigured(
+                f"{model._meta.label} is sharded; pick the database with .using() "
+                "(see loans.sharding) or go through a related instance"
+            )
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_read(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not shard_aliases():
+            return None
+        if obj1._state.db and obj2._state.db:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        aliases = shard_aliases()
+        if not aliases:
+            return None
+        if app_label == "loans" and model_name in SHARDED_MODELS:
+            return db in aliases
+        if db in aliases:
+            return False
+        return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db and is_replica(instance._state.db):
+            return primary_for(instance._state.db)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        db1, db2 = obj1._state.db, obj2._state.db
+        if db1 and db2 and (is_replica(db1) or is_replica(db2)):
+            return primary_for(db1) == primary_for(db2)
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if is_replica(db):
+            return False
+        return None
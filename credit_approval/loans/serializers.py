@@ -1,5 +1,7 @@
 from rest_framework import serializers
 
+from .batches import JOB_TYPES
+
 
 class RegisterSerializer(serializers.Serializer):
     first_name = serializers.CharField(max_length=80)
@@ -14,3 +16,8 @@ class LoanRequestSerializer(serializers.Serializer):
     loan_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
     interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
     tenure = serializers.IntegerField(min_value=1)
+
+
+class JobSubmitSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=sorted(JOB_TYPES))
+    params = serializers.DictField(required=False, default=dict)
@@ -0,0 +1,129 @@
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models import F
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from .models import Customer, Loan, ShardSequence
+from .replicas import mark_unhealthy, read_database
+
+
+def shard_aliases() -> list[str]:
+    return list(getattr(settings, "LOAN_SHARDS", []))
+
+
+def is_sharded() -> bool:
+    return bool(shard_aliases())
+
+
+def all_shards() -> list[str]:
+    return shard_aliases() or [DEFAULT_DB_ALIAS]
+
+
+def shard_for_customer(customer_id: int) -> str:
+    aliases = shard_aliases()
+    if not aliases:
+        return DEFAULT_DB_ALIAS
+    return aliases[int(customer_id) % len(aliases)]
+
+
+def shard_for_loan(loan_id: int) -> str:
+    # Loan ids are allocated on the same residue class as their customer's shard.
+    return shard_for_customer(loan_id)
+
+
+def shard_for_phone_number(phone_number: str) -> str:
+    aliases = shard_aliases()
+    if not aliases:
+        return DEFAULT_DB_ALIAS
+    for alias in aliases:
+        if Customer.objects.using(alias).filter(phone_number=phone_number).exists():
+            return alias
+    return aliases[zlib.crc32(phone_number.encode()) % len(aliases)]
+
+
+def _read_first(queryset, primary: str, customer_id: int | None = None):
+    # The queryset must load everything the caller reads, so a failing replica
+    # is only ever touched inside this block.
+    alias = read_database(primary, customer_id)
+    if alias != primary:
+        try:
+            found = queryset.using(alias).first()
+        except DatabaseError:
+            mark_unhealthy(alias)
+            found = None
+        # A miss may just mean the replica has not caught up with a recent write.
+        if found is not None:
+            return found
+    return queryset.using(primary).first()
+
+
+def locate_customer(customer_id: int, queryset=None):
+    if queryset is None:
+        queryset = Customer.objects.prefetch_related("loans")
+    return _read_first(queryset.filter(id=customer_id), shard_for_customer(customer_id), customer_id)
+
+
+def locate_loan(loan_id: int, queryset=None):
+    if queryset is None:
+        queryset = Loan.objects.select_related("customer")
+    home = shard_for_loan(loan_id)
+    # Ingested loans keep their spreadsheet ids, which may not match their shard.
+    for alias in [home] + [alias for alias in shard_aliases() if alias != home]:
+        found = _read_first(queryset.filter(id=loan_id), alias)
+        if found is not None:
+            return found
+    return None
+
+
+def allocate_id(model, alias: str) -> int | None:
+    aliases = shard_aliases()
+    if not aliases:
+        return None
+    step = len(aliases)
+    name = model._meta.label_lower
+    sequences = ShardSequence.objects.using(alias)
+    with transaction.atomic(using=alias):
+        # The sequence row exists after the first allocation (or an ingest), so this is usually one UPDATE.
+        if not sequences.filter(name=name).update(last_value=F("last_value") + step):
+            sequences.get_or_create(name=name, defaults={"last_value": aliases.index(alias)})
+            sequences.filter(name=name).update(last_value=F("last_value") + step)
+        return sequences.values_list("last_value", flat=True).get(name=name)
+
+
+@receiver(pre_save, sender=Customer)
+@receiver(pre_save, sender=Loan)
+def _allocate_sharded_id(sender, instance, using, raw, **kwargs):
+    # The shard's own autoincrement ignores the residue scheme and would collide with other shards.
+    if instance.pk is None and not raw:
+        instance.pk = allocate_id(sender, using)
+
+
+def reserve_ids(model, floor: int) -> None:
+    aliases = shard_aliases()
+    step = len(aliases)
+    name = model._meta.label_lower
+    for index, alias in enumerate(aliases):
+        value = floor - ((floor - index) % step)
+        sequence, _ = ShardSequence.objects.using(alias).get_or_create(name=name, defaults={"last_value": index})
+        if sequence.last_value < value:
+            sequence.last_value = value
+            sequence.save(using=alias, update_fields=["last_value"])
+
+
+def fan_out(func, aliases: list[str] | None = None) -> dict:
+    aliases = aliases if aliases is not None else all_shards()
+
+    def run(alias):
+        try:
+            return func(alias)
+        finally:
+            connections[alias].close()
+
+    if len(aliases) <= 1:
+        return {alias: func(alias) for alias in aliases}
+    with ThreadPoolExecutor(max_workers=len(aliases)) as executor:
+        return dict(zip(aliases, executor.map(run, aliases)))
@@ -1,38 +1,77 @@
+import json
+import math
+import threading
+import time
 from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
 from dateutil.relativedelta import relativedelta
-from django.test import TestCase
-from django.urls import reverse
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import OperationalError, connections, transaction
+from django.db.models.query import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 from django.utils import timezone
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 from rest_framework.test import APIClient
 
-from .models import Customer, Loan
+from . import replicas
+from . import urls as loans_urls
+from .admission import AdmissionController, Rejected
+from .batches import JobType, RefreshCurrentDebt
+from .jobs import claim_chunk, work
+from .models import Customer, Job, JobChunk, Loan
+from .query_budget import QueryBudgetExceeded, QueryRecorder
+from .replicas import is_replica, mark_unhealthy, pin_customer, read_database
+from .routers import ReplicaRouter, ShardRouter
+from .sharding import all_shards, locate_loan, shard_for_customer, shard_for_loan
+
+
+def create_customer(alias=None, **fields):
+    """Create a customer the same way with or without shards (on the first shard by default)."""
+    fields = {
+        "first_name": "Ada",
+        "last_name": "Lovelace",
+        "phone_number": "9000000000",
+        "age": 30,
+        "monthly_income": 50000,
+        "approved_limit": Decimal("2000000"),
+        **fields,
+    }
+    return Customer.objects.using(alias or all_shards()[0]).create(**fields)
+
+
+def create_loan(customer, **fields):
+    """Create an approved loan for customer, active for another nine months unless overridden."""
+    today = timezone.now().date()
+    fields = {
+        "loan_amount": Decimal("500000"),
+        "tenure": 12,
+        "interest_rate": Decimal("12"),
+        "monthly_installment": Decimal("15000"),
+        "emis_paid_on_time": 12,
+        "start_date": today - relativedelta(months=3),
+        "end_date": today + relativedelta(months=9),
+        "approved": True,
+        **fields,
+    }
+    return customer.loans.create(**fields)
 
 
 class LoanAPITest(TestCase):
+    databases = "__all__"
+
     def setUp(self):
         self.client = APIClient()
-        self.customer = Customer.objects.create(
-            first_name="Ada",
-            last_name="Lovelace",
-            phone_number="9000000000",
-            age=30,
-            monthly_income=50000,
-            approved_limit=Decimal("2000000"),
-            current_debt=Decimal("0"),
-        )
-        Loan.objects.create(
-            customer=self.customer,
-            loan_amount=Decimal("500000"),
-            tenure=12,
-            interest_rate=Decimal("12"),
-            monthly_installment=Decimal("15000"),
-            emis_paid_on_time=12,
-            start_date=timezone.now().date() - relativedelta(months=3),
-            end_date=timezone.now().date() + relativedelta(months=9),
-            approved=True,
-        )
+        self.customer = create_customer()
+        create_loan(self.customer)
 
     def test_register_sets_limit_rounding(self):
         payload = {
@@ -63,16 +102,14 @@ class LoanAPITest(TestCase):
         self.assertGreater(data["monthly_installment"], 0)
 
     def test_create_loan_denied_when_emis_exceed_half_salary(self):
-        Loan.objects.create(
-            customer=self.customer,
+        create_loan(
+            self.customer,
             loan_amount=Decimal("400000"),
-            tenure=12,
             interest_rate=Decimal("15"),
             monthly_installment=Decimal("26000"),
             emis_paid_on_time=6,
             start_date=timezone.now().date(),
             end_date=timezone.now().date() + relativedelta(months=12),
-            approved=True,
         )
         payload = {
             "customer_id": self.customer.id,
@@ -103,3 +140,548 @@ class LoanAPITest(TestCase):
         list_response = self.client.get(reverse("view-loans", args=[self.customer.id]))
         assert list_response.status_code == status.HTTP_200_OK
         self.assertTrue(len(list_response.json()) >= 1)
+
+    @override_settings(
+        ADMISSION_CONTROL={
+            "CAPACITY": 0,
+            "ENDPOINTS": {"check-eligibility": {"CONCURRENCY": 1, "QUEUE": 0, "MAX_WAIT": 0.1, "PRIORITY": 1}},
+        }
+    )
+    def test_overloaded_eligibility_check_is_shed(self):
+        payload = {
+            "customer_id": self.customer.id,
+            "loan_amount": Decimal("300000"),
+            "interest_rate": Decimal("8.00"),
+            "tenure": 24,
+        }
+        response = self.client.post(reverse("check-eligibility"), payload, format="json")
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        self.assertEqual(response.headers["Retry-After"], "1")
+        self.assertEqual(self.client.get(reverse("admission-stats")).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(get_user_model()(username="ops", is_staff=True))
+        stats = self.client.get(reverse("admission-stats")).json()
+        self.assertEqual(stats["endpoints"]["check-eligibility"]["shed"], 1)
+
+    def test_loadtest_reports_latency_per_endpoint(self):
+        out = StringIO()
+        call_command(
+            "loadtest",
+            requests=30,
+            concurrency=1,
+            mix="check-eligibility=1,view-loan=1,view-loans=1",
+            seed=7,
+            format="json",
+            stdout=out,
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["total"]["requests"], 30)
+        self.assertEqual(report["total"]["error_rate"], 0)
+        self.assertEqual(set(report["endpoints"]), {"check-eligibility", "view-loan", "view-loans"})
+        self.assertLessEqual(report["total"]["p50_ms"], report["total"]["p99_ms"])
+
+    def test_loadtest_duration_is_not_capped_by_default_requests(self):
+        def run(**options):
+            out = StringIO()
+            call_command("loadtest", concurrency=1, mix="view-loans=1", format="json", stdout=out, **options)
+            return json.loads(out.getvalue())["total"]["requests"]
+
+        with mock.patch("loans.management.commands.loadtest.DEFAULT_REQUESTS", 5):
+            self.assertEqual(run(), 5)
+            self.assertGreater(run(duration=0.5), 5)
+
+    def test_view_loans_answers_not_modified_until_a_write(self):
+        url = reverse("view-loans", args=[self.customer.id])
+        etag = self.client.get(url).headers["ETag"]
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+        self.assertEqual(cached.headers["ETag"], etag)
+        payload = {
+            "customer_id": self.customer.id,
+            "loan_amount": Decimal("100000"),
+            "interest_rate": Decimal("16"),
+            "tenure": 12,
+        }
+        self.client.post(reverse("create-loan"), payload, format="json")
+        refreshed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert refreshed.status_code == status.HTTP_200_OK
+        self.assertNotEqual(refreshed.headers["ETag"], etag)
+
+    def test_queryset_delete_invalidates_view_loans_etag(self):
+        url = reverse("view-loans", args=[self.customer.id])
+        etag = self.client.get(url).headers["ETag"]
+        Loan.objects.using(self.customer._state.db).filter(customer=self.customer).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.json(), [])
+
+    def test_view_loan_etag_tracks_customer_edits(self):
+        loan = self.customer.loans.get()
+        url = reverse("view-loan", args=[loan.id])
+        etag = self.client.get(url).headers["ETag"]
+        assert self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+        self.customer.age = 31
+        self.customer.save(update_fields=["age"])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        self.assertEqual(response.json()["customer"]["age"], 31)
+
+
+class ShardRoutingTest(SimpleTestCase):
+    def test_unsharded_routes_to_default(self):
+        with override_settings(LOAN_SHARDS=[]):
+            self.assertEqual(shard_for_customer(7), "default")
+            self.assertIsNone(ShardRouter().allow_migrate("default", "loans", model_name="loan"))
+
+    @override_settings(LOAN_SHARDS=["shard_0", "shard_1"])
+    def test_sharded_query_without_a_shard_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ShardRouter().db_for_read(Customer)
+        self.assertIsNone(ShardRouter().db_for_read(Job))
+
+    @override_settings(LOAN_SHARDS=["shard_0", "shard_1", "shard_2"])
+    def test_ids_route_by_residue(self):
+        self.assertEqual(shard_for_customer(7), "shard_1")
+        self.assertEqual(shard_for_loan(9), "shard_0")
+        router = ShardRouter()
+        self.assertTrue(router.allow_migrate("shard_2", "loans", model_name="customer"))
+        self.assertFalse(router.allow_migrate("default", "loans", model_name="loan"))
+        self.assertFalse(router.allow_migrate("shard_2", "auth", model_name="user"))
+
+
+class LoanAdminTest(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        user = get_user_model().objects.create_superuser("ops", "ops@example.com", "password")
+        self.client.force_login(user)
+        today = timezone.now().date()
+        # The changelists read the first shard unless another is picked.
+        self.connection = connections[all_shards()[0]]
+        for index in range(3):
+            customer = create_customer(last_name=f"Lovelace {index}", phone_number=f"900000000{index}")
+            for months in (-6, 6):
+                create_loan(
+                    customer,
+                    loan_amount=Decimal("100000"),
+                    start_date=today - relativedelta(months=12),
+                    end_date=today + relativedelta(months=months),
+                )
+
+    def test_customer_changelist_annotates_loans_in_one_page_query(self):
+        url = reverse("admin:loans_customer_changelist")
+        self.client.get(url)
+        with CaptureQueriesContext(self.connection) as queries:
+            response = self.client.get(url)
+        customer_queries = [query for query in queries if "loans_customer" in query["sql"]]
+        self.assertEqual(len(customer_queries), 2)
+        row = response.context["cl"].result_list[0]
+        self.assertEqual(row.loan_count, 2)
+        self.assertEqual(row.active_debt, Decimal("100000"))
+
+    def test_loan_changelist_selects_customers_with_rows(self):
+        url = reverse("admin:loans_loan_changelist")
+        self.client.get(url)
+        with CaptureQueriesContext(self.connection) as queries:
+            self.client.get(url)
+        loan_queries = [query for query in queries if "loans_loan" in query["sql"]]
+        self.assertEqual(len(loan_queries), 2)
+
+    def test_search_matches_exact_phone_or_id(self):
+        customer = Customer.objects.using(all_shards()[0]).get(phone_number="9000000001")
+        url = reverse("admin:loans_customer_changelist")
+        by_phone = self.client.get(url, {"q": "9000000001"}).context["cl"].result_list
+        by_id = self.client.get(url, {"q": str(customer.id)}).context["cl"].result_list
+        self.assertEqual([row.id for row in by_phone], [customer.id])
+        self.assertEqual([row.id for row in by_id], [customer.id])
+
+    @skipUnless(settings.LOAN_SHARDS, "SHARD_DATABASE_URLS is not configured")
+    def test_changelists_read_the_chosen_shard(self):
+        alias = all_shards()[-1]
+        customer = create_customer(alias, first_name="Grace", last_name="Hopper", phone_number="9123456789")
+        url = reverse("admin:loans_customer_changelist")
+        rows = self.client.get(url, {"shard": alias}).context["cl"].result_list
+        self.assertEqual([row.id for row in rows], [customer.id])
+        self.assertNotIn(customer.id, [row.id for row in self.client.get(url).context["cl"].result_list])
+        response = self.client.get(reverse("admin:loans_customer_change", args=[customer.id]))
+        self.assertEqual(response.context["original"], customer)
+
+
+BUDGET_REQUESTS = {
+    "register": lambda test: (
+        "post",
+        [],
+        {
+            "first_name": "Grace",
+            "last_name": "Hopper",
+            "age": 25,
+            "monthly_income": 55000,
+            "phone_number": "9123456789",
+        },
+    ),
+    "check-eligibility": lambda test: (
+        "post",
+        [],
+        {"customer_id": test.customer.id, "loan_amount": "300000", "interest_rate": "8.00", "tenure": 24},
+    ),
+    "create-loan": lambda test: (
+        "post",
+        [],
+        {"customer_id": test.customer.id, "loan_amount": "200000", "interest_rate": "12", "tenure": 12},
+    ),
+    "view-loan": lambda test: ("get", [test.loan.id], None),
+    "view-loans": lambda test: ("get", [test.customer.id], None),
+    "admission-stats": lambda test: ("get", [], None),
+    "submit-job": lambda test: ("post", [], {"kind": "refresh_current_debt"}),
+    "job-status": lambda test: ("get", [Job.objects.create(kind="refresh_current_debt").id], None),
+    "retry-job": lambda test: (
+        "post",
+        [Job.objects.create(kind="refresh_current_debt", status=Job.Status.FAILED).id],
+        None,
+    ),
+}
+
+
+# Tests enforce query counts only; DB time depends on the machine running them.
+COUNT_ONLY_BUDGETS = {name: {**budget, "DB_TIME_MS": math.inf} for name, budget in settings.QUERY_BUDGETS.items()}
+
+
+@override_settings(QUERY_BUDGET_ACTION="raise", QUERY_BUDGETS=COUNT_ONLY_BUDGETS)
+class QueryBudgetTest(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.client = APIClient()
+        # Staff endpoints are measured through a real session, which costs a session and a user lookup.
+        self.staff_client = APIClient()
+        self.staff_client.force_login(get_user_model().objects.create_user("ops", is_staff=True))
+        self.customer = create_customer()
+        self.loan = create_loan(self.customer)
+
+    def test_transaction_control_is_not_counted(self):
+        recorder = QueryRecorder()
+        with recorder.record(), transaction.atomic():
+            Job.objects.exists()
+        # Outside TestCase's transaction SQLite sends BEGIN for the outermost atomic block.
+        for sql in ("BEGIN", "COMMIT", "ROLLBACK"):
+            recorder(lambda *args: None, sql, None, False, {})
+        self.assertEqual(recorder.queries, 1)
+
+    def test_over_budget_request_fails(self):
+        budgets = {**settings.QUERY_BUDGETS, "view-loans": {"QUERIES": 0, "DB_TIME_MS": 1000}}
+        with override_settings(QUERY_BUDGETS=budgets), self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse("view-loans", args=[self.customer.id]))
+
+
+def _make_budget_test(url_name):
+    def test(self):
+        self.assertIn(url_name, BUDGET_REQUESTS, f"add a sample request for '{url_name}' to BUDGET_REQUESTS")
+        method, args, payload = BUDGET_REQUESTS[url_name](self)
+        url = reverse(url_name, args=args)
+        staff_only = IsAdminUser in resolve(url).func.view_class.permission_classes
+        client = self.staff_client if staff_only else self.client
+        if method == "get":
+            response = client.get(url)
+        else:
+            response = client.post(url, payload, format="json")
+        self.assertLess(response.status_code, 500)
+
+    return test
+
+
+for _pattern in loans_urls.urlpatterns:
+    setattr(QueryBudgetTest, f"test_{_pattern.name.replace('-', '_')}_within_budget", _make_budget_test(_pattern.name))
+
+
+class AdmissionControlTest(SimpleTestCase):
+    def make_controller(self, capacity=1, queue=4, max_wait=1.0):
+        return AdmissionController(
+            capacity,
+            {
+                "create-loan": {"CONCURRENCY": capacity, "QUEUE": queue, "MAX_WAIT": max_wait, "PRIORITY": 0},
+                "check-eligibility": {"CONCURRENCY": capacity, "QUEUE": queue, "MAX_WAIT": max_wait, "PRIORITY": 1},
+            },
+        )
+
+    def test_full_queue_sheds_with_429(self):
+        controller = self.make_controller(queue=0)
+        controller.acquire("check-eligibility")
+        with self.assertRaises(Rejected) as raised:
+            controller.acquire("check-eligibility")
+        self.assertEqual(raised.exception.status, 429)
+        self.assertEqual(controller.snapshot()["endpoints"]["check-eligibility"]["shed"], 1)
+
+    def test_free_slot_is_not_shed_behind_other_endpoints_waiters(self):
+        controller = AdmissionController(
+            2,
+            {
+                "create-loan": {"CONCURRENCY": 1, "QUEUE": 0, "MAX_WAIT": 1.0, "PRIORITY": 0},
+                "check-eligibility": {"CONCURRENCY": 1, "QUEUE": 1, "MAX_WAIT": 10.0, "PRIORITY": 1},
+            },
+        )
+        controller.acquire("check-eligibility")
+        waiter = threading.Thread(target=controller.acquire, args=("check-eligibility",))
+        waiter.start()
+        self.wait_for_queue_depth(controller, 1)
+        controller.acquire("create-loan")
+        self.assertEqual(controller.snapshot()["endpoints"]["create-loan"]["shed"], 0)
+        controller.release("check-eligibility")
+        waiter.join()
+
+    def test_wait_past_deadline_fails_with_503(self):
+        controller = self.make_controller(max_wait=0.05)
+        controller.acquire("create-loan")
+        with self.assertRaises(Rejected) as raised:
+            controller.acquire("create-loan")
+        self.assertEqual(raised.exception.status, 503)
+        self.assertEqual(raised.exception.retry_after, 1)
+        self.assertEqual(controller.snapshot()["queue_depth"], 0)
+
+    def wait_for_queue_depth(self, controller, depth, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while controller.snapshot()["queue_depth"] != depth:
+            if time.monotonic() > deadline:
+                self.fail(f"queue never reached depth {depth}")
+            time.sleep(0.001)
+
+    def test_create_loan_is_admitted_before_queued_eligibility_checks(self):
+        controller = self.make_controller(max_wait=10.0)
+        controller.acquire("create-loan")
+        admitted = []
+
+        def wait_for(endpoint):
+            controller.acquire(endpoint)
+            admitted.append(endpoint)
+            controller.release(endpoint)
+
+        endpoints = ("check-eligibility", "create-loan")
+        threads = [threading.Thread(target=wait_for, args=(endpoint,)) for endpoint in endpoints]
+        for depth, thread in enumerate(threads, start=1):
+            thread.start()
+            self.wait_for_queue_depth(controller, depth)
+        controller.release("create-loan")
+        for thread in threads:
+            thread.join()
+        self.assertEqual(admitted, ["create-loan", "check-eligibility"])
+
+
+@override_settings(DATABASE_REPLICAS={"default": ["default_replica_0"]})
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_recent_writer_is_pinned_to_primary(self):
+        pin_customer(42)
+        self.assertEqual(read_database("default", 42), "default")
+
+    def test_unhealthy_replica_fails_over_to_primary(self):
+        mark_unhealthy("default_replica_0")
+        self.assertEqual(read_database("default", 7), "default")
+
+    def test_replicas_are_never_migrated(self):
+        self.assertFalse(ReplicaRouter().allow_migrate("default_replica_0", "loans", model_name="loan"))
+        self.assertIsNone(ReplicaRouter().allow_migrate("default", "loans", model_name="loan"))
+
+
+@override_settings(DATABASE_REPLICAS={alias: [f"{alias}_replica_0"] for alias in all_shards()})
+class ReplicaReadTest(TestCase):
+    """Drive the views with a simulated replica that lags behind or fails."""
+
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        replicas._unhealthy_until.clear()
+        self.addCleanup(replicas._unhealthy_until.clear)
+        self.client = APIClient()
+        self.customer = create_customer()
+        self.replica_reads = []
+
+    def use_replica(self, read):
+        original_first = QuerySet.first
+
+        def first(queryset):
+            if not is_replica(queryset.db):
+                return original_first(queryset)
+            self.replica_reads.append(queryset.model._meta.model_name)
+            return read()
+
+        def healthy(alias):
+            # The replica aliases have no connection here; health follows mark_unhealthy only.
+            return replicas._unhealthy_until.get(alias, 0) <= time.monotonic()
+
+        patchers = [mock.patch.object(QuerySet, "first", first), mock.patch.object(replicas, "_is_healthy", healthy)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create_loan(self):
+        payload = {"customer_id": self.customer.id, "loan_amount": "200000", "interest_rate": "12", "tenure": 12}
+        response = self.client.post(reverse("create-loan"), payload, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        return response.json()["loan_id"]
+
+    def test_new_loan_is_visible_while_the_replica_lags(self):
+        self.use_replica(lambda: None)
+        loan_id = self.create_loan()
+        loans = self.client.get(reverse("view-loans", args=[self.customer.id])).json()
+        self.assertEqual([loan["loan_id"] for loan in loans], [loan_id])
+        # The writer is pinned, so its list never touched the replica.
+        self.assertEqual(self.replica_reads, [])
+        response = self.client.get(reverse("view-loan", args=[loan_id]))
+        assert response.status_code == status.HTTP_200_OK
+        self.assertEqual(response.json()["loan_id"], loan_id)
+        # Loan lookups are not pinned: the replica missed and the primary answered.
+        self.assertIn("loan", self.replica_reads)
+
+    def test_unpinned_reads_use_the_replica(self):
+        self.use_replica(lambda: None)
+        self.client.get(reverse("view-loans", args=[self.customer.id]))
+        self.assertIn("customer", self.replica_reads)
+
+    def test_replica_error_falls_back_to_primary(self):
+        def broken():
+            raise OperationalError("replica is down")
+
+        self.use_replica(broken)
+        loan_id = self.create_loan()
+        cache.clear()
+        response = self.client.get(reverse("view-loans", args=[self.customer.id]))
+        assert response.status_code == status.HTTP_200_OK
+        self.assertEqual([loan["loan_id"] for loan in response.json()], [loan_id])
+        reads = len(self.replica_reads)
+        self.assertEqual(reads, 1)
+        # The failed replica is skipped until REPLICA_RETRY_SECONDS pass.
+        self.client.get(reverse("view-loan", args=[loan_id]))
+        self.assertEqual(len(self.replica_reads), reads)
+
+
+@skipUnless(settings.LOAN_SHARDS, "SHARD_DATABASE_URLS is not configured")
+class ShardedLoanAPITest(TestCase):
+    databases = "__all__"
+
+    def test_new_ids_encode_their_shard(self):
+        client = APIClient()
+        payload = {
+            "first_name": "Grace",
+            "last_name": "Hopper",
+            "age": 25,
+            "monthly_income": 55000,
+            "phone_number": "9123456789",
+        }
+        customer_id = client.post(reverse("register"), payload, format="json").json()["customer_id"]
+        shard = shard_for_customer(customer_id)
+        self.assertTrue(Customer.objects.using(shard).filter(id=customer_id).exists())
+        payload = {
+            "customer_id": customer_id,
+            "loan_amount": Decimal("100000"),
+            "interest_rate": Decimal("16"),
+            "tenure": 12,
+        }
+        loan_id = client.post(reverse("create-loan"), payload, format="json").json()["loan_id"]
+        self.assertEqual(shard_for_loan(loan_id), shard)
+        view_response = self.client.get(reverse("view-loan", args=[loan_id]))
+        self.assertEqual(view_response.json()["customer"]["id"], customer_id)
+
+    def test_related_creates_take_ids_from_their_shard(self):
+        customers = [
+            create_customer(alias, phone_number=f"900000000{index}") for index, alias in enumerate(all_shards())
+        ]
+        for customer in customers:
+            self.assertEqual(shard_for_customer(customer.id), customer._state.db)
+            for _ in range(3):
+                loan = create_loan(customer)
+                self.assertEqual(shard_for_loan(loan.id), customer._state.db)
+                self.assertEqual(locate_loan(loan.id).customer_id, customer.id)
+
+
+@override_settings(JOB_QUEUE={**settings.JOB_QUEUE, "CHUNK_SIZE": 100, "RETRY_DELAY": 0, "POLL_INTERVAL": 0})
+class JobQueueTest(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model()(username="ops", is_staff=True))
+
+    def test_job_endpoints_require_staff(self):
+        job = Job.objects.create(kind="refresh_current_debt", status=Job.Status.FAILED)
+        requests = [
+            ("post", reverse("submit-job"), {"kind": "ingest_initial_data"}),
+            ("get", reverse("job-status", args=[job.id]), None),
+            ("post", reverse("retry-job", args=[job.id]), None),
+        ]
+        anonymous = APIClient()
+        customer = APIClient()
+        customer.force_authenticate(get_user_model()(username="customer"))
+        for method, url, payload in requests:
+            with self.subTest(url=url):
+                for client in (anonymous, customer):
+                    response = getattr(client, method)(url, payload, format="json")
+                    self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Job.objects.count(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+
+    def test_ingest_job_reports_progress(self):
+        response = self.client.post(reverse("submit-job"), {"kind": "ingest_initial_data"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        work(burst=True)
+        report = self.client.get(response["Location"]).json()
+        self.assertEqual(report["status"], "succeeded")
+        self.assertEqual(report["processed_rows"], report["total_rows"])
+        self.assertEqual(report["eta_seconds"], 0.0)
+        self.assertGreater(report["throughput_rows_per_second"], 0)
+        chunks = JobChunk.objects.filter(job_id=report["job_id"])
+        self.assertEqual(report["chunks"]["done"], chunks.count())
+        for chunk in chunks.exclude(params__step="reserve_ids"):
+            self.assertEqual({shard_for_customer(row[0]) for row in chunk.params["rows"]}, {chunk.params["alias"]})
+        self.assertEqual(sum(Customer.objects.using(alias).count() for alias in all_shards()), 300)
+
+    def test_ingest_if_not_done_queues_only_once(self):
+        call_command("ingest_initial_data", "--enqueue", "--if-not-done", stdout=StringIO())
+        call_command("ingest_initial_data", "--enqueue", "--if-not-done", stdout=StringIO())
+        self.assertEqual(Job.objects.filter(kind="ingest_initial_data").count(), 1)
+        Job.objects.update(status=Job.Status.FAILED)
+        call_command("ingest_initial_data", "--enqueue", "--if-not-done", stdout=StringIO())
+        self.assertEqual(Job.objects.filter(kind="ingest_initial_data").count(), 2)
+
+    def test_inline_ingest_leaves_other_jobs_queued(self):
+        other = Job.objects.create(kind="refresh_current_debt")
+        call_command("ingest_initial_data", stdout=StringIO())
+        self.assertEqual(Job.objects.get(kind="ingest_initial_data").status, Job.Status.SUCCEEDED)
+        other.refresh_from_db()
+        self.assertEqual(other.status, Job.Status.QUEUED)
+
+    def test_submit_rejects_files_outside_the_project(self):
+        payload = {"kind": "ingest_initial_data", "params": {"customer_file": "../customer_data.xlsx"}}
+        response = self.client.post(reverse("submit-job"), payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Job.objects.exists())
+
+    def test_job_kinds_must_implement_plan_and_run(self):
+        class Incomplete(JobType):
+            def plan(self, params):
+                return []
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_later_stages_wait_for_earlier_chunks(self):
+        job = Job.objects.create(kind="refresh_current_debt", status=Job.Status.RUNNING)
+        first = JobChunk.objects.create(job=job, stage=0)
+        JobChunk.objects.create(job=job, stage=1)
+        self.assertEqual(claim_chunk("a"), first)
+        self.assertIsNone(claim_chunk("b"))
+
+    def test_failing_chunk_is_retried_then_fails_the_job(self):
+        create_customer()
+        job = Job.objects.create(kind="refresh_current_debt")
+        with mock.patch.object(RefreshCurrentDebt, "run", side_effect=RuntimeError("boom")) as run:
+            work(burst=True)
+        self.assertEqual(run.call_count, settings.JOB_QUEUE["MAX_ATTEMPTS"])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (Job.Status.FAILED, "RuntimeError: boom"))
+        response = self.client.post(reverse("retry-job", args=[job.id]))
+        self.assertEqual(response.json()["status"], "running")
+        work(burst=True)
+        self.assertEqual(self.client.get(reverse("job-status", args=[job.id])).json()["status"], "succeeded")
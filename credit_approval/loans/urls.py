@@ -1,9 +1,13 @@
 from django.urls import path
 
 from .views import (
+    AdmissionStatsView,
     CheckEligibilityView,
     CreateLoanView,
     CustomerLoansView,
+    JobRetryView,
+    JobStatusView,
+    JobSubmitView,
     LoanDetailView,
     RegisterView,
 )
@@ -14,4 +18,8 @@ urlpatterns = [
     path("create-loan/", CreateLoanView.as_view(), name="create-loan"),
     path("view-loan/<int:loan_id>/", LoanDetailView.as_view(), name="view-loan"),
     path("view-loans/<int:customer_id>/", CustomerLoansView.as_view(), name="view-loans"),
+    path("admission-stats/", AdmissionStatsView.as_view(), name="admission-stats"),
+    path("jobs/", JobSubmitView.as_view(), name="submit-job"),
+    path("jobs/<int:job_id>/", JobStatusView.as_view(), name="job-status"),
+    path("jobs/<int:job_id>/retry/", JobRetryView.as_view(), name="retry-job"),
 ]
@@ -1,14 +1,23 @@
 from decimal import Decimal
 
 from dateutil.relativedelta import relativedelta
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Customer, Loan
-from .serializers import LoanRequestSerializer, RegisterSerializer
+from .admission import get_controller
+from .jobs import progress, retry, submit
+from .models import Customer, Job, Loan
+from .replicas import pin_customer
+from .serializers import JobSubmitSerializer, LoanRequestSerializer, RegisterSerializer
+from .sharding import locate_customer, locate_loan, shard_for_customer, shard_for_phone_number
 
 
 def round_to_nearest_lakh(value: Decimal) -> int:
@@ -115,22 +124,36 @@ def evaluate_loan(customer: Customer, loan_amount: Decimal, requested_rate: Deci
     }
 
 
+def make_etag(key: str, updated_at) -> str:
+    return f'"{key}-{int(updated_at.timestamp() * 1_000_000)}"'
+
+
+def not_modified_response(request, etag: str):
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response.headers["ETag"] = etag
+    return response
+
+
 class RegisterView(APIView):
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
         approved_limit = round_to_nearest_lakh(Decimal(data["monthly_income"]) * Decimal("36"))
-        customer, created = Customer.objects.update_or_create(
+        shard = shard_for_phone_number(data["phone_number"])
+        defaults = {
+            "first_name": data["first_name"],
+            "last_name": data["last_name"],
+            "age": data["age"],
+            "monthly_income": data["monthly_income"],
+            "approved_limit": Decimal(approved_limit),
+        }
+        customer, created = Customer.objects.using(shard).update_or_create(
             phone_number=data["phone_number"],
-            defaults={
-                "first_name": data["first_name"],
-                "last_name": data["last_name"],
-                "age": data["age"],
-                "monthly_income": data["monthly_income"],
-                "approved_limit": Decimal(approved_limit),
-            },
+            defaults=defaults,
         )
+        pin_customer(customer.id)
         response_data = {
             "customer_id": customer.id,
             "name": customer.name,
@@ -147,7 +170,9 @@ class CheckEligibilityView(APIView):
     def post(self, request):
         serializer = LoanRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        customer = get_object_or_404(Customer, id=serializer.validated_data["customer_id"])
+        customer = locate_customer(serializer.validated_data["customer_id"])
+        if customer is None:
+            raise Http404
         loan_amount = Decimal(serializer.validated_data["loan_amount"])
         interest_rate = Decimal(serializer.validated_data["interest_rate"])
         tenure = serializer.validated_data["tenure"]
@@ -169,7 +194,9 @@ class CreateLoanView(APIView):
     def post(self, request):
         serializer = LoanRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        customer = get_object_or_404(Customer, id=serializer.validated_data["customer_id"])
+        customer_id = serializer.validated_data["customer_id"]
+        customers = Customer.objects.using(shard_for_customer(customer_id)).prefetch_related("loans")
+        customer = get_object_or_404(customers, id=customer_id)
         loan_amount = Decimal(serializer.validated_data["loan_amount"])
         interest_rate = Decimal(serializer.validated_data["interest_rate"])
         tenure = serializer.validated_data["tenure"]
@@ -187,7 +214,8 @@ class CreateLoanView(APIView):
             )
         start_date = timezone.now().date()
         end_date = start_date + relativedelta(months=tenure)
-        loan = Loan.objects.create(
+        shard = customer._state.db
+        loan = Loan.objects.using(shard).create(
             customer=customer,
             loan_amount=loan_amount,
             tenure=tenure,
@@ -197,9 +225,11 @@ class CreateLoanView(APIView):
             end_date=end_date,
             approved=True,
         )
-        active_amount = sum((ln.loan_amount for ln in customer.loans.filter(end_date__gte=start_date)), Decimal("0"))
+        # The new loan is active and the prefetched loans hold the rest, so no second scan is needed.
+        active_amount = sum((ln.loan_amount for ln in customer.loans.all() if ln.end_date >= start_date), loan_amount)
         customer.current_debt = active_amount
-        customer.save(update_fields=["current_debt"])
+        customer.save(using=shard, update_fields=["current_debt"])
+        pin_customer(customer.id)
         return Response(
             {
                 "loan_id": loan.id,
@@ -214,7 +244,16 @@ class CreateLoanView(APIView):
 
 class LoanDetailView(APIView):
     def get(self, request, loan_id):
-        loan = get_object_or_404(Loan, id=loan_id)
+        # Every loan write touches the customer, so its updated_at versions the whole body.
+        updated_at = locate_loan(loan_id, Loan.objects.values_list("customer__updated_at", flat=True))
+        if updated_at is None:
+            raise Http404
+        not_modified = not_modified_response(request, make_etag(f"loan-{loan_id}", updated_at))
+        if not_modified is not None:
+            return not_modified
+        loan = locate_loan(loan_id)
+        if loan is None:
+            raise Http404
         return Response(
             {
                 "loan_id": loan.id,
@@ -229,14 +268,23 @@ class LoanDetailView(APIView):
                 "interest_rate": float(loan.interest_rate),
                 "monthly_installment": float(loan.monthly_installment),
                 "tenure": loan.tenure,
-            }
+            },
+            headers={"ETag": make_etag(f"loan-{loan_id}", loan.customer.updated_at)},
         )
 
 
 class CustomerLoansView(APIView):
     def get(self, request, customer_id):
-        customer = get_object_or_404(Customer, id=customer_id)
-        loans = customer.loans.filter(approved=True)
+        updated_at = locate_customer(customer_id, Customer.objects.values_list("updated_at", flat=True))
+        if updated_at is None:
+            raise Http404
+        not_modified = not_modified_response(request, make_etag(f"customer-{customer_id}", updated_at))
+        if not_modified is not None:
+            return not_modified
+        customer = locate_customer(customer_id)
+        if customer is None:
+            raise Http404
+        loans = [loan for loan in customer.loans.all() if loan.approved]
         return Response(
             [
                 {
@@ -254,5 +302,57 @@ class CustomerLoansView(APIView):
                     "tenure": loan.tenure,
                 }
                 for loan in loans
-            ]
+            ],
+            headers={"ETag": make_etag(f"customer-{customer_id}", customer.updated_at)},
+        )
+
+
+class AdmissionStatsView(APIView):
+    # Queue depths and shed counts describe the service's internals, not a customer's data.
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_controller().snapshot())
+
+
+class JobSubmitView(APIView):
+    # Jobs rewrite live customer and loan rows, so only staff may run or inspect them.
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = JobSubmitSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            job = submit(**serializer.validated_data)
+        except ValueError as exc:
+            raise ValidationError({"params": [str(exc)]}) from exc
+        return Response(
+            {"job_id": job.id, "kind": job.kind, "status": job.status, "params": job.params},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": reverse("job-status", args=[job.id])},
+        )
+
+
+class JobStatusView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, job_id):
+        return Response(progress(get_object_or_404(Job, id=job_id)))
+
+
+class JobRetryView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, job_id):
+        job = get_object_or_404(Job, id=job_id)
+        new_status = retry(job)
+        if new_status is None:
+            return Response(
+                {"message": f"Job is {job.status}; only failed jobs can be retried"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(
+            {"job_id": job.id, "status": new_status},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": reverse("job-status", args=[job.id])},
         )